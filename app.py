@@ -1,9 +1,19 @@
 import streamlit as st
-from PIL import Image, ImageCms
+from PIL import Image, ImageCms, TiffImagePlugin
 import io
 import os
+import hashlib
 import tempfile
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from cmyka_tiff import save_cmyka_tiff
+
+try:
+    # PyTurboJPEG es opcional: sin él (o sin libturbojpeg) se usa el codificador de Pillow
+    from turbojpeg import TurboJPEG, TJPF_CMYK, TJSAMP_444, TJFLAG_PROGRESSIVE
+except ImportError:
+    TurboJPEG = None
 
 # --- Configuración de la Página de Streamlit ---
 st.set_page_config(
@@ -17,20 +27,173 @@ SRGB_PROFILE = "profiles/sRGB_IEC61966-2-1.icc"
 ADOBE_RGB_PROFILE = "profiles/AdobeRGB1998.icc"
 # Usamos el nombre del archivo de alta compatibilidad FOGRA39_v3.icc
 CMYK_PROFILE = "profiles/FOGRA39_v3.icc"
+# Perfiles RGB de origen reconocibles cuando vienen incrustados en la imagen
+RGB_PROFILE_NAMES = {SRGB_PROFILE: "sRGB", ADOBE_RGB_PROFILE: "Adobe RGB 1998"}
 TARGET_DPI = (150, 150) # Resolución fija de 150 DPI
+# Compresión TIFF: Deflate (libtiff, con predictor horizontal) es más rápida y compacta que LZW
+TIFF_COMPRESSION = {
+    "Deflate (Recomendado)": "tiff_adobe_deflate",
+    "LZW (Compatibilidad con RIPs antiguos)": "tiff_lzw",
+    "Sin compresión (Máxima compatibilidad con Photoshop)": "raw",
+}
+# Nombre corto de cada compresión para el resumen del archivo generado
+TIFF_COMPRESSION_NAMES = {value: label.split(' (')[0] for label, value in TIFF_COMPRESSION.items()}
+# Salida de 8 bits: sin caché de píxel de LCMS (evita contención) y con compensación de punto negro
+TRANSFORM_FLAGS = ImageCms.Flags.NOCACHE | ImageCms.Flags.BLACKPOINTCOMPENSATION
+# Rendering intent de impresión: colorimétrico relativo (con BPC, ver TRANSFORM_FLAGS)
+PRINT_INTENT = ImageCms.Intent.RELATIVE_COLORIMETRIC
+# A partir de este tamaño (~16 MP) el TIFF se codifica a un archivo temporal en lugar de a RAM
+LARGE_IMAGE_PIXELS = 16_000_000
+# Alto de cada franja: acota la memoria extra de la transformación a STRIP_ROWS filas por hilo
+STRIP_ROWS = 512
+TRANSFORM_WORKERS = min(os.cpu_count() or 1, 8)
+
+# --- Caché de Perfiles y Transformaciones ICC (una vez por proceso) ---
+@st.cache_resource
+def read_profile_file(path: str) -> bytes:
+    """Lee el archivo .icc de disco una sola vez por proceso."""
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@st.cache_resource
+def get_profile(path: str) -> ImageCms.ImageCmsProfile:
+    """Parsea un perfil ICC una sola vez por proceso, desde los bytes ya leídos."""
+    return ImageCms.getOpenProfile(io.BytesIO(read_profile_file(path)))
+
+
+@st.cache_resource
+def get_profile_bytes(path: str) -> bytes:
+    """Serializa el perfil con .tobytes() una sola vez por proceso (compartido entre sesiones)."""
+    return get_profile(path).tobytes()
+
+
+@st.cache_resource
+def get_transform(src_path: str, dst_path: str, intent: int, in_mode: str = 'RGB', out_mode: str = 'CMYK', flags: int = TRANSFORM_FLAGS) -> ImageCms.ImageCmsTransform:
+    """Construye la transformación LittleCMS una sola vez por (origen, intent, flags) y la reutiliza."""
+    return ImageCms.buildTransform(
+        get_profile(src_path),
+        get_profile(dst_path),
+        in_mode,
+        out_mode,
+        renderingIntent=intent,
+        flags=flags
+    )
+
+
+@st.cache_resource
+def warm_transforms() -> bool:
+    """Precalienta al arrancar las transformaciones habituales para que la primera petición no pague su construcción."""
+    for src_path in (SRGB_PROFILE, ADOBE_RGB_PROFILE):
+        for in_mode in ('RGB', 'RGBA'):
+            get_transform(src_path, CMYK_PROFILE, PRINT_INTENT, in_mode=in_mode)
+    return True
+
+
+@st.cache_resource
+def get_numba_cmyk():
+    """Importa la ruta rápida de Numba solo la primera vez que se necesita; None si Numba no está instalado."""
+    try:
+        # Importación diferida: numba (y su JIT) no se cargan al arrancar si nadie convierte desde sRGB
+        import numba_cmyk
+    except ImportError:
+        return None
+    return numba_cmyk
+
+
+@st.cache_resource
+def get_srgb_clut() -> np.ndarray:
+    """CLUT sRGB -> FOGRA39 (relative colorimetric) para la ruta rápida de Numba, una vez por proceso."""
+    return get_numba_cmyk().build_clut(get_transform(SRGB_PROFILE, CMYK_PROFILE, PRINT_INTENT))
+
+
+@st.cache_resource
+def get_executor() -> ThreadPoolExecutor:
+    """Pool de hilos compartido por todas las sesiones para la transformación por franjas.
+
+    Cada sesión de Streamlit ejecuta el script en su propio hilo y LittleCMS libera el
+    GIL, así que una conversión larga no bloquea a los demás usuarios; este pool único
+    acota además el total de hilos LCMS cuando varias sesiones convierten a la vez.
+    """
+    return ThreadPoolExecutor(max_workers=TRANSFORM_WORKERS, thread_name_prefix="lcms")
+
+
+def apply_transform(img: Image.Image, transform: ImageCms.ImageCmsTransform) -> Image.Image:
+    """Aplica la transformación por franjas de STRIP_ROWS filas, en paralelo (LittleCMS libera el GIL)."""
+    if img.height <= STRIP_ROWS:
+        return ImageCms.applyTransform(img, transform)
+
+    # La transformación se construye con NOCACHE, así que puede compartirse entre hilos.
+    # Cada franja se recorta dentro de su hilo y se pega en cuanto termina, así que nunca
+    # hay más que unas pocas franjas vivas además de la imagen de entrada y la de salida
+    boxes = [(0, y, img.width, min(y + STRIP_ROWS, img.height)) for y in range(0, img.height, STRIP_ROWS)]
+    convert_strip = lambda box: ImageCms.applyTransform(img.crop(box), transform)
+    strips = get_executor().map(convert_strip, boxes) if TRANSFORM_WORKERS > 1 else map(convert_strip, boxes)
+
+    out = Image.new(transform.output_mode, img.size)
+    for box, strip in zip(boxes, strips):
+        out.paste(strip, box[:2])
+    return out
+
+
+@st.cache_resource
+def get_turbojpeg():
+    """Instancia de TurboJPEG (DCT/Huffman SIMD de libjpeg-turbo) o None si no está disponible o no puede incrustar ICC."""
+    if TurboJPEG is None:
+        return None
+    try:
+        turbo = TurboJPEG()
+        # Incrustar el perfil ICC requiere libjpeg-turbo >= 3.1 (tj3SetICCProfile): con una
+        # versión anterior el constructor funciona pero encode() falla. Se prueba una vez.
+        turbo.encode(
+            np.zeros((1, 1, 4), dtype=np.uint8),
+            pixel_format=TJPF_CMYK,
+            jpeg_subsample=TJSAMP_444,
+            icc_profile=get_profile_bytes(CMYK_PROFILE)
+        )
+    except RuntimeError:
+        # El paquete está instalado pero no encuentra la librería nativa libturbojpeg
+        return None
+    except (NotImplementedError, OSError):
+        # libturbojpeg sin soporte de perfiles ICC: se usa el codificador de Pillow
+        return None
+    return turbo
+
+
+@st.cache_resource
+def get_profile_digests(path: str) -> frozenset:
+    """MD5 del perfil tal como está en disco y tal como lo serializa ImageCms (.tobytes())."""
+    return frozenset((hashlib.md5(read_profile_file(path)).digest(), hashlib.md5(get_profile_bytes(path)).digest()))
+
+
+def has_embedded_profile(img: Image.Image, path: str) -> bool:
+    """Indica si el perfil ICC incrustado en la imagen es exactamente el perfil de `path`."""
+    icc = img.info.get('icc_profile')
+    return bool(icc) and hashlib.md5(icc).digest() in get_profile_digests(path)
+
+
+@st.cache_resource
+def verify_profiles() -> bool:
+    """Comprueba una sola vez por proceso (no en cada reejecución) que existen los perfiles ICC."""
+    if not all(os.path.exists(p) for p in [SRGB_PROFILE, ADOBE_RGB_PROFILE, CMYK_PROFILE]):
+        raise FileNotFoundError("No se encontraron todos los perfiles ICC necesarios.")
+    return True
+
 
 # --- Cargar Perfiles ICC al Inicio y Obtener Bytes CMYK Válidos ---
 CMYK_PROFILE_BYTES = None
 try:
-    if not all(os.path.exists(p) for p in [SRGB_PROFILE, ADOBE_RGB_PROFILE, CMYK_PROFILE]):
-        raise FileNotFoundError("No se encontraron todos los perfiles ICC necesarios.")
+    # Si falla no queda cacheado, así que se vuelve a comprobar en la siguiente ejecución
+    verify_profiles()
         
-    # 1. Cargar el perfil CMYK como objeto ImageCms
-    cmyk_profile_obj = ImageCms.getOpenProfile(CMYK_PROFILE)
-    
-    # 2. Obtener la representación binaria COMPATIBLE usando .tobytes()
+    # 1. Cargar el perfil CMYK y obtener la representación binaria COMPATIBLE usando .tobytes()
     # Esta es la parte crítica que resuelve el error de validación de Photoshop.
-    CMYK_PROFILE_BYTES = cmyk_profile_obj.tobytes()
+    # Se serializa una sola vez por proceso (no en cada reejecución ni en cada sesión);
+    # cada guardado reutiliza este mismo objeto `bytes` en lugar de volver a leer el .icc.
+    CMYK_PROFILE_BYTES = get_profile_bytes(CMYK_PROFILE)
+
+    # 2. Construir las transformaciones sRGB/AdobeRGB -> FOGRA39 una vez por proceso
+    warm_transforms()
 
 except FileNotFoundError:
     st.error("🚨 Error: No se encontraron los archivos ICC.")
@@ -42,43 +205,90 @@ except Exception as e:
     st.stop()
 
 
-def convert_rgb_to_cmyk(img: Image.Image, source_profile_path: str, cmyk_profile_obj) -> Image.Image:
-    """Convierte una imagen RGB a CMYK conservando la transparencia si es posible."""
-    
-    # 1. Preparar la Imagen y el Canal Alpha
-    is_transparent = img.mode == 'RGBA'
-    
-    if is_transparent:
-        rgb_img = img.convert('RGB')
-        alpha_channel = img.getchannel('A')
-    else:
-        rgb_img = img.convert('RGB')
-        alpha_channel = None
-
-    # 2. Conversión de Color (RGB -> CMYK)
-    try:
-        # Cargamos el perfil RGB de origen
-        source_profile = ImageCms.getOpenProfile(source_profile_path)
-        
-        # Aplicar la transformación (rendering intent 1: relative colorimetric, común para impresión)
-        # Usamos el objeto cmyk_profile_obj que ya fue cargado al inicio
-        cmyk_img = ImageCms.profileToProfile(
-            rgb_img, 
-            source_profile, 
-            cmyk_profile_obj, 
-            renderingIntent=1, 
-            outputMode='CMYK'
-        )
-    except Exception as e:
-        st.error(f"Error durante la conversión de color (profileToProfile): {e}")
-        return None
+@st.cache_data(max_entries=4, ttl=600, show_spinner=False)
+def decode_image(file_id: str, _upload) -> Image.Image:
+    """Decodifica el archivo subido una vez por subida (``file_id``); ``_upload`` no se hashea.
 
-    # 3. Recomponer con el Canal Alpha (Si existía)
-    if is_transparent and cmyk_img.mode == 'CMYK':
-        # Reincorporamos el canal Alpha al CMYK (creando CMYKA)
-        cmyk_img.putalpha(alpha_channel)
-        
-    return cmyk_img
+    PIL lee directamente del ``UploadedFile`` (ya es un ``BytesIO``), sin copiar sus bytes.
+    """
+    _upload.seek(0)
+    return Image.open(_upload).copy()
+
+
+def standardize_mode(img: Image.Image) -> Image.Image:
+    """Lleva los modos no RGB (P, L, LA, I;16...) a RGB o RGBA para la conversión ICC."""
+    if img.mode in ['RGB', 'RGBA', 'CMYK']:
+        return img
+    if img.mode in ['I', 'I;16', 'I;16L', 'I;16B', 'I;16N']:
+        # 16 bits por canal: se cuantiza a 8 bits (>> 8) antes de la conversión ICC.
+        # .convert('RGB') recortaría todo valor > 255 a blanco en lugar de escalarlo.
+        img = Image.fromarray((np.asarray(img).clip(0, 65535) >> 8).astype(np.uint8))
+    # Un único .convert en C (también desempaqueta la paleta); los PNG en modo P
+    # con color transparente pasan a RGBA para no perder la transparencia
+    has_alpha = img.mode.endswith('A') or (img.mode == 'P' and 'transparency' in img.info)
+    return img.convert('RGBA' if has_alpha else 'RGB')
+
+
+def convert_rgb_to_cmyk(img: Image.Image, source_profile_path: str, intent: int = PRINT_INTENT) -> Image.Image:
+    """Convierte una imagen RGB/RGBA a CMYK; el canal alpha, si existe, se ignora.
+
+    Los errores se propagan: quien llama los muestra, y así ``st.cache_data`` no guarda
+    un fallo (que quedaría pegado a la subida hasta que expire el TTL).
+    """
+    # Transformación cacheada por (perfil de origen, intent): no se reconstruye por imagen
+    # (por defecto relative colorimetric, común para impresión).
+    # LittleCMS lee RGBA directamente e ignora el alpha, así que no hace falta una copia RGB.
+    fast_path = get_numba_cmyk() if source_profile_path == SRGB_PROFILE and intent == PRINT_INTENT else None
+    if fast_path is not None:
+        # Ruta rápida del caso más común: CLUT de LittleCMS + kernel Numba paralelo
+        return fast_path.apply_clut(img, get_srgb_clut())
+    transform = get_transform(source_profile_path, CMYK_PROFILE, intent, in_mode=img.mode)
+    return apply_transform(img, transform)
+
+@st.cache_data(max_entries=4, ttl=600, show_spinner=False)
+def run_conversion(file_id: str, _upload, source_profile_path: str, intent: int = PRINT_INTENT) -> Image.Image:
+    """Conversión a CMYK cacheada por (subida, perfil de origen, intent), sin alpha.
+
+    La clave no depende del formato de salida: cambiar entre TIFF y JPEG reutiliza la
+    misma conversión y solo se reincorpora el alpha (barato) cuando la salida es TIFF.
+    """
+    return convert_rgb_to_cmyk(standardize_mode(decode_image(file_id, _upload)), source_profile_path, intent)
+
+@st.cache_data(max_entries=4, ttl=600, show_spinner=False)
+def preview_thumbnail(file_id: str, _img: Image.Image) -> Image.Image:
+    """Miniatura de la barra lateral, una vez por subida: Streamlit no recodifica la imagen completa en cada reejecución."""
+    thumb = _img.copy()
+    # BILINEAR basta para 256 px y es bastante más barato que LANCZOS
+    thumb.thumbnail((256, 256), Image.Resampling.BILINEAR)
+    return thumb
+
+def new_output_buffer(img: Image.Image, compression: str = None, extra_samples: int = 0) -> io.BytesIO:
+    """Crea el BytesIO de salida; solo se pre-dimensiona cuando el tamaño final se conoce.
+
+    Un TIFF sin compresión ocupa exactamente los píxeles más el perfil incrustado. Con
+    Deflate/LZW o JPEG cualquier cota reservaría (y rellenaría con ceros) mucha más
+    memoria que el archivo real, así que se deja crecer al BytesIO.
+    """
+    if compression != "raw":
+        return io.BytesIO()
+    # Píxeles + perfil + holgura para cabecera e IFD
+    estimate = img.width * img.height * (len(img.getbands()) + extra_samples) + len(CMYK_PROFILE_BYTES) + 4096
+    buffer = io.BytesIO(bytes(estimate))
+    buffer.seek(0)
+    return buffer
+
+def cleanup_temp_output():
+    """Cierra (y con ello borra) el TIFF temporal que haya quedado de la ejecución anterior de la sesión."""
+    temp_output = st.session_state.pop('temp_output', None)
+    if temp_output is not None:
+        temp_output.close()
+
+def temp_output_reader(path: str):
+    """Callable diferido para download_button: lee el TIFF temporal solo cuando el usuario hace clic."""
+    def read() -> bytes:
+        with open(path, 'rb') as f:
+            return f.read()
+    return read
 
 # --- Interfaz de Usuario ---
 st.title("🎨 Conversor RGB a CMYK")
@@ -106,89 +316,180 @@ output_format = st.selectbox(
     ("TIFF (Impresión - Recomendado)", "JPEG (Prueba/Web - CMYK)")
 )
 
+with st.expander("Opciones avanzadas"):
+    tiff_compression_choice = st.selectbox(
+        "Compresión TIFF:",
+        tuple(TIFF_COMPRESSION),
+        help="Deflate con predictor horizontal es más rápido y más compacto, y lo leen todos los RIP de preimpresión actuales. Usa LZW o sin compresión solo si tu flujo lo exige."
+    )
+
+
+# El TIFF temporal de la ejecución anterior ya no lo referencia ningún botón: se cierra y se borra
+cleanup_temp_output()
 
 if uploaded_file is not None:
     try:
-        input_img = Image.open(uploaded_file)
+        # El file_id de la subida es la clave de caché: interactuar con los widgets no
+        # vuelve a decodificar ni a convertir la misma imagen, y no hay que copiar ni
+        # hashear los bytes del archivo en cada reejecución
+        file_id = uploaded_file.file_id
+        input_img = decode_image(file_id, uploaded_file)
+        # Lo asigna la rama CMYK de origen o la conversión; None si ninguna produjo imagen
+        cmyk_img = None
         
         # --- CHEQUEO DE MODO DE IMAGEN PARA ESTANDARIZACIÓN ---
         if input_img.mode not in ['RGB', 'RGBA']:
             
             if input_img.mode == 'CMYK':
-                st.warning("⚠️ Atención: La imagen que subiste ya está en modo CMYK. Se procederá solo con la resolución y el formato.")
+                # Origen y destino comparten perfil: la transformación sería la identidad
+                if has_embedded_profile(input_img, CMYK_PROFILE):
+                    st.info("ℹ️ La imagen ya está en CMYK con el perfil FOGRA39 incrustado: no se aplica ninguna transformación de color.")
+                else:
+                    st.warning("⚠️ Atención: La imagen que subiste ya está en modo CMYK. Se procederá solo con la resolución y el formato.")
                 cmyk_img = input_img.copy() 
             else:
                 try:
-                    if 'A' in input_img.mode or input_img.mode == 'LA': 
-                        input_img = input_img.convert('RGBA')
-                    else:
-                        input_img = input_img.convert('RGB')
+                    input_img = standardize_mode(input_img)
                     st.info(f"ℹ️ Modo de imagen original estandarizado a {input_img.mode} para la conversión.")
                 except Exception as ex:
                     st.error(f"❌ Error crítico: No se puede estandarizar el modo de imagen '{input_img.mode}'. Detalle: {ex}")
                     st.stop()
         
+        # Tras estandarizar, solo RGBA conserva transparencia: se calcula una vez
+        has_alpha = input_img.mode == 'RGBA'
+
         # Mostrar detalles de la imagen subida
         st.sidebar.subheader("Imagen Original")
-        st.sidebar.image(input_img, caption=f"Modo: {input_img.mode}, Tamaño: {input_img.size}")
-        st.sidebar.markdown(f"**¿Tiene Transparencia (Alpha)?** {'Sí' if 'A' in input_img.mode else 'No'}")
+        st.sidebar.image(preview_thumbnail(file_id, input_img), caption=f"Modo: {input_img.mode}, Tamaño: {input_img.size}")
+        st.sidebar.markdown(f"**¿Tiene Transparencia (Alpha)?** {'Sí' if has_alpha else 'No'}")
 
 
         # 4. Iniciar la Conversión
         with st.spinner("Realizando conversión de color a FOGRA39..."):
             
+            file_extension = ".tif" if output_format == "TIFF (Impresión - Recomendado)" else ".jpg"
+            mime_type = "image/tiff" if output_format == "TIFF (Impresión - Recomendado)" else "image/jpeg"
+
             # Ejecutar la conversión solo si no es CMYK de origen
             if input_img.mode in ['RGB', 'RGBA']:
-                # Pasamos el objeto cmyk_profile_obj ya cargado
-                cmyk_img = convert_rgb_to_cmyk(input_img, source_profile_path, cmyk_profile_obj) 
+                # Si la imagen trae incrustado uno de los perfiles RGB conocidos, ese manda sobre
+                # la selección: evita convertir con el espacio equivocado y reutiliza su transformación
+                embedded_source = next((path for path in RGB_PROFILE_NAMES if has_embedded_profile(input_img, path)), None)
+                if embedded_source is not None and embedded_source != source_profile_path:
+                    st.info(f"ℹ️ La imagen trae incrustado el perfil {RGB_PROFILE_NAMES[embedded_source]}: se usa ese perfil en lugar del seleccionado.")
+                    source_profile_path = embedded_source
+
+                # Resultado cacheado; la transformación LittleCMS viene de la caché de recursos.
+                # La conversión ignora el alpha: solo la salida TIFF lo escribe, aparte.
+                try:
+                    cmyk_img = run_conversion(file_id, uploaded_file, source_profile_path)
+                except Exception as e:
+                    # Fuera de la función cacheada: un fallo no se memoriza y el siguiente intento reconvierte
+                    st.error(f"Error durante la conversión de color (applyTransform): {e}")
             
-            if 'cmyk_img' not in locals() or cmyk_img is None:
+            if cmyk_img is None:
                 st.warning("La conversión falló. Revisa el mensaje de error.")
                 st.stop()
                 
             st.success("✅ Conversión completada a CMYK (FOGRA39 / ISO Coated v2).")
 
             # 5. Generar Archivo de Salida para Descarga
-            file_extension = ".tif" if output_format == "TIFF (Impresión - Recomendado)" else ".jpg"
-            mime_type = "image/tiff" if output_format == "TIFF (Impresión - Recomendado)" else "image/jpeg"
             
-            output_buffer = io.BytesIO()
+            # TIFF grande: se codifica directamente a disco (/tmp) en lugar de mantener
+            # el archivo completo en RAM junto a la imagen y la copia de descarga
+            tiff_compression = TIFF_COMPRESSION[tiff_compression_choice] if file_extension == ".tif" else None
+            # JPEG no admite alpha: solo la salida TIFF lo conserva, como muestra extra del CMYK
+            alpha_channel = input_img.getchannel('A') if has_alpha and file_extension == ".tif" else None
+            if alpha_channel is not None and tiff_compression == "tiff_lzw":
+                st.info("ℹ️ Para CMYK con transparencia se usa Deflate en lugar de LZW.")
+                tiff_compression = "tiff_adobe_deflate"
+            stream_to_disk = file_extension == ".tif" and cmyk_img.width * cmyk_img.height >= LARGE_IMAGE_PIXELS
+            if stream_to_disk:
+                # Se guarda abierto en la sesión: NamedTemporaryFile borra el archivo al cerrarse
+                # (en la siguiente ejecución) o al recolectarse si la sesión termina antes
+                output_target = st.session_state['temp_output'] = tempfile.NamedTemporaryFile(suffix=file_extension)
+            else:
+                output_target = new_output_buffer(cmyk_img, tiff_compression, extra_samples=int(alpha_channel is not None))
             
-            if file_extension == ".tif":
+            if alpha_channel is not None:
+                # Pillow no tiene modo CMYKA (putalpha convertiría la imagen a RGBA): el TIFF
+                # se escribe como CMYK + ExtraSamples (alpha), con el mismo perfil y DPI
+                save_cmyka_tiff(output_target, cmyk_img, alpha_channel, TARGET_DPI, CMYK_PROFILE_BYTES, tiff_compression)
+
+            elif file_extension == ".tif":
                 # Guardado TIFF: incrustar perfil y DPI
                 # Utilizamos CMYK_PROFILE_BYTES generado con .tobytes()
                 cmyk_img.save(
-                    output_buffer, 
+                    output_target, 
                     format='TIFF', 
                     dpi=TARGET_DPI,
                     icc_profile=CMYK_PROFILE_BYTES, 
+                    compression=tiff_compression,
+                    # Predictor horizontal (diferencias entre píxeles vecinos): mejora mucho el ratio.
+                    # Solo tiene sentido con compresión; sin ella el lector lo aplicaría a datos en crudo
+                    tiffinfo={TiffImagePlugin.PREDICTOR: 2} if tiff_compression != "raw" else {},
                 )
             
             elif file_extension == ".jpg":
-                cmyk_img.convert('CMYK').save( 
-                    output_buffer, 
-                    format='JPEG', 
-                    quality=95, 
-                    optimize=True
-                )
+                # Sin alpha reincorporado, cmyk_img ya es CMYK: no hace falta .convert('CMYK')
+                turbo = get_turbojpeg()
+                if turbo is not None:
+                    # libjpeg-turbo escribe JPEG CMYK con marcador Adobe, que se lee invertido:
+                    # se invierte igual que hace Pillow ("CMYK;I") y sin submuestreo
+                    output_target.write(turbo.encode(
+                        np.invert(np.asarray(cmyk_img)),
+                        quality=95,
+                        pixel_format=TJPF_CMYK,
+                        jpeg_subsample=TJSAMP_444,
+                        # Progresivo (implica tablas Huffman optimizadas): archivo más pequeño
+                        flags=TJFLAG_PROGRESSIVE,
+                        icc_profile=CMYK_PROFILE_BYTES
+                    ))
+                else:
+                    cmyk_img.save( 
+                        output_target, 
+                        format='JPEG', 
+                        quality=95, 
+                        optimize=True,
+                        progressive=True,
+                        # Sin submuestreo: los cuatro canales (también K) a resolución completa
+                        subsampling=0,
+                        # El perfil FOGRA39 también va incrustado en el JPEG para las herramientas posteriores
+                        icc_profile=CMYK_PROFILE_BYTES
+                    )
+
+            if stream_to_disk:
+                output_target.flush()
+            else:
+                # Recortar la reserva sobrante (si la hubo) al tamaño real del archivo codificado
+                output_target.truncate()
+                output_target.seek(0)
 
-            output_buffer.seek(0)
+            # El archivo ya está codificado: se sueltan las imágenes decodificadas antes de
+            # que download_button copie el resultado, para no tener ambas a la vez en RAM
+            del cmyk_img, input_img, alpha_channel
             
             # --- Botón de Descarga ---
             st.markdown("---")
             st.subheader("Descarga de Archivo Final")
+            # TIFF grande: descarga diferida, el archivo se lee de /tmp solo al hacer clic.
+            # on_click="ignore" evita la reejecución, que cerraría (y borraría) el temporal.
             st.download_button(
                 label=f"⬇️ Descargar Archivo CMYK {file_extension.upper()}",
-                data=output_buffer,
+                data=temp_output_reader(output_target.name) if stream_to_disk else output_target,
                 file_name=f"imagen_cmyk{file_extension}",
-                mime=mime_type
+                mime=mime_type,
+                on_click="ignore"
             )
+            # La sesión queda como única dueña del temporal: si termina sin otra ejecución,
+            # el archivo se borra al recolectarse su estado (el script no lo retiene)
+            del output_target
             
             st.markdown(f"""
             **Características del archivo:**
             * **Modo de Color:** CMYK (FOGRA39 / ISO Coated v2)
             * **DPI:** 150x150
-            * **Formato:** {file_extension.upper()}
+            * **Formato:** {file_extension.upper()}{f" ({TIFF_COMPRESSION_NAMES[tiff_compression]})" if file_extension == ".tif" else ""}{" con canal alpha" if has_alpha and file_extension == ".tif" else ""}
             """)
 
     except Exception as e:
@@ -0,0 +1,104 @@
+"""Escritura de TIFF CMYK con canal alpha (CMYK + ExtraSamples).
+
+Pillow no tiene un modo CMYKA: ``putalpha`` sobre una imagen CMYK la convierte a RGBA,
+así que el TIFF guardado dejaría de ser CMYK. Este módulo escribe directamente un TIFF
+baseline de 5 muestras por píxel (PhotometricInterpretation = Separated, con la quinta
+muestra declarada como alpha no asociado), leyendo la imagen por franjas para no
+materializar una copia CMYKA completa en memoria.
+"""
+import struct
+import zlib
+
+import numpy as np
+from PIL import Image
+
+# Códigos de compresión TIFF que sabe escribir este módulo (mismos nombres que Pillow)
+COMPRESSION_CODES = {"raw": 1, "tiff_adobe_deflate": 8}
+# Franjas de ~64 KB sin comprimir, del orden de las que escribe libtiff
+STRIP_BYTES = 64 * 1024
+
+_SHORT, _LONG, _RATIONAL, _UNDEFINED = 3, 4, 5, 7
+
+
+def _entry(tag: int, field_type: int, values) -> tuple:
+    """Codifica una entrada del IFD como (tag, tipo, count, bytes del valor)."""
+    if field_type == _UNDEFINED:
+        return tag, field_type, len(values), bytes(values)
+    fmt = 'H' if field_type == _SHORT else 'I'
+    count = len(values) // 2 if field_type == _RATIONAL else len(values)
+    return tag, field_type, count, struct.pack(f'<{len(values)}{fmt}', *values)
+
+
+def save_cmyka_tiff(fp, cmyk_img: Image.Image, alpha_channel: Image.Image, dpi: tuple, icc_profile: bytes, compression: str = "tiff_adobe_deflate") -> None:
+    """Escribe en ``fp`` un TIFF CMYK de 8 bits con ``alpha_channel`` como muestra extra.
+
+    ``compression`` es ``"raw"`` o ``"tiff_adobe_deflate"``; con Deflate se aplica el
+    predictor horizontal, como en la salida TIFF de Pillow.
+    """
+    if compression not in COMPRESSION_CODES:
+        raise ValueError(f"Compresión no soportada para CMYK con alpha: {compression}")
+    compressed = compression != "raw"
+    width, height = cmyk_img.size
+    rows_per_strip = max(1, STRIP_BYTES // (width * 5))
+
+    start = fp.tell()
+    # Cabecera little-endian; el offset del IFD se completa al final
+    fp.write(b'II*\x00' + struct.pack('<I', 0))
+    pos = 8
+
+    strip_offsets, strip_byte_counts = [], []
+    for y in range(0, height, rows_per_strip):
+        box = (0, y, width, min(y + rows_per_strip, height))
+        strip = np.concatenate([np.asarray(cmyk_img.crop(box)), np.asarray(alpha_channel.crop(box))[..., None]], axis=2)
+        if compressed:
+            # Predictor horizontal: cada muestra menos la del píxel anterior (módulo 256)
+            strip[:, 1:] = strip[:, 1:] - strip[:, :-1]
+            data = zlib.compress(strip.tobytes())
+        else:
+            data = strip.tobytes()
+        strip_offsets.append(pos)
+        strip_byte_counts.append(len(data))
+        fp.write(data)
+        pos += len(data)
+
+    entries = [
+        _entry(256, _LONG, [width]),                                   # ImageWidth
+        _entry(257, _LONG, [height]),                                  # ImageLength
+        _entry(258, _SHORT, [8] * 5),                                  # BitsPerSample
+        _entry(259, _SHORT, [COMPRESSION_CODES[compression]]),         # Compression
+        _entry(262, _SHORT, [5]),                                      # Photometric: Separated (CMYK)
+        _entry(273, _LONG, strip_offsets),                             # StripOffsets
+        _entry(277, _SHORT, [5]),                                      # SamplesPerPixel
+        _entry(278, _LONG, [rows_per_strip]),                          # RowsPerStrip
+        _entry(279, _LONG, strip_byte_counts),                         # StripByteCounts
+        _entry(282, _RATIONAL, [int(round(dpi[0])), 1]),               # XResolution
+        _entry(283, _RATIONAL, [int(round(dpi[1])), 1]),               # YResolution
+        _entry(284, _SHORT, [1]),                                      # PlanarConfiguration: chunky
+        _entry(296, _SHORT, [2]),                                      # ResolutionUnit: pulgadas
+        _entry(338, _SHORT, [2]),                                      # ExtraSamples: alpha no asociado
+        _entry(34675, _UNDEFINED, icc_profile),                        # ICCProfile
+    ]
+    if compressed:
+        entries.append(_entry(317, _SHORT, [2]))                       # Predictor: horizontal
+
+    # Los valores de más de 4 bytes van fuera del IFD, alineados a palabra
+    if pos % 2:
+        fp.write(b'\x00')
+        pos += 1
+    ifd_entries = []
+    for tag, field_type, count, payload in sorted(entries):
+        if len(payload) <= 4:
+            ifd_entries.append(struct.pack('<HHI', tag, field_type, count) + payload.ljust(4, b'\x00'))
+            continue
+        ifd_entries.append(struct.pack('<HHII', tag, field_type, count, pos))
+        fp.write(payload)
+        pos += len(payload)
+        if pos % 2:
+            fp.write(b'\x00')
+            pos += 1
+
+    fp.write(struct.pack('<H', len(ifd_entries)) + b''.join(ifd_entries) + struct.pack('<I', 0))
+    end = fp.tell()
+    fp.seek(start + 4)
+    fp.write(struct.pack('<I', pos))
+    fp.seek(end)
@@ -0,0 +1,91 @@
+"""Ruta rápida RGB -> CMYK con Numba para la conversión más común (sRGB -> FOGRA39).
+
+La transformación de LittleCMS se "hornea" una sola vez en un CLUT de 33x33x33 puntos
+y cada píxel se interpola con el mismo esquema tetraédrico que usa LittleCMS en su
+ruta optimizada de 8 bits, en paralelo sobre todas las filas de la imagen.
+
+Vive en su propio módulo (y no en app.py) porque Streamlit re-ejecuta el script en
+cada interacción: así el kernel se compila una vez por proceso y no en cada rerun.
+"""
+import threading
+
+import numpy as np
+from numba import config, njit, prange
+from PIL import Image, ImageCms
+
+# Streamlit llama al kernel desde el hilo de cada sesión, no desde el hilo principal:
+# OpenMP primero, porque con TBB el proceso se queda colgado al terminar en ese caso
+config.THREADING_LAYER_PRIORITY = ["omp", "tbb", "workqueue"]
+# Un único lanzamiento a la vez (cada uno ya usa todos los núcleos); así también es
+# seguro con "workqueue", que no admite lanzamientos concurrentes desde varios hilos
+_KERNEL_LOCK = threading.Lock()
+
+# Misma rejilla que LittleCMS elige para entradas RGB de 8 bits (una de 17 puntos
+# se desvía hasta 12 niveles por canal; con 33 la diferencia máxima es de 3)
+CLUT_GRID_POINTS = 33
+
+
+def build_clut(transform: ImageCms.ImageCmsTransform, grid_points: int = CLUT_GRID_POINTS) -> np.ndarray:
+    """Evalúa una transformación RGB -> CMYK en una rejilla regular y devuelve el CLUT (N, N, N, 4)."""
+    axis = np.round(np.linspace(0, 255, grid_points)).astype(np.uint8)
+    r, g, b = np.meshgrid(axis, axis, axis, indexing='ij')
+    grid = np.stack([r, g, b], axis=-1)
+    grid_img = Image.frombytes('RGB', (grid_points ** 3, 1), grid.tobytes())
+    cmyk = ImageCms.applyTransform(grid_img, transform)
+    return np.asarray(cmyk).reshape(grid_points, grid_points, grid_points, 4).astype(np.float32)
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _tetrahedral_kernel(src, clut, out):
+    height, width = src.shape[0], src.shape[1]
+    n = clut.shape[0] - 1
+    scale = n / 255.0
+    for y in prange(height):
+        for x in range(width):
+            fr = src[y, x, 0] * scale
+            fg = src[y, x, 1] * scale
+            fb = src[y, x, 2] * scale
+            r0 = min(int(fr), n - 1)
+            g0 = min(int(fg), n - 1)
+            b0 = min(int(fb), n - 1)
+            rx = fr - r0
+            ry = fg - g0
+            rz = fb - b0
+            for c in range(4):
+                c000 = clut[r0, g0, b0, c]
+                c111 = clut[r0 + 1, g0 + 1, b0 + 1, c]
+                if rx >= ry and ry >= rz:
+                    c100 = clut[r0 + 1, g0, b0, c]
+                    c110 = clut[r0 + 1, g0 + 1, b0, c]
+                    v = c000 + (c100 - c000) * rx + (c110 - c100) * ry + (c111 - c110) * rz
+                elif rx >= rz and rz >= ry:
+                    c100 = clut[r0 + 1, g0, b0, c]
+                    c101 = clut[r0 + 1, g0, b0 + 1, c]
+                    v = c000 + (c100 - c000) * rx + (c111 - c101) * ry + (c101 - c100) * rz
+                elif rz >= rx and rx >= ry:
+                    c001 = clut[r0, g0, b0 + 1, c]
+                    c101 = clut[r0 + 1, g0, b0 + 1, c]
+                    v = c000 + (c101 - c001) * rx + (c111 - c101) * ry + (c001 - c000) * rz
+                elif ry >= rx and rx >= rz:
+                    c010 = clut[r0, g0 + 1, b0, c]
+                    c110 = clut[r0 + 1, g0 + 1, b0, c]
+                    v = c000 + (c110 - c010) * rx + (c010 - c000) * ry + (c111 - c110) * rz
+                elif ry >= rz and rz >= rx:
+                    c010 = clut[r0, g0 + 1, b0, c]
+                    c011 = clut[r0, g0 + 1, b0 + 1, c]
+                    v = c000 + (c111 - c011) * rx + (c010 - c000) * ry + (c011 - c010) * rz
+                else:
+                    c001 = clut[r0, g0, b0 + 1, c]
+                    c011 = clut[r0, g0 + 1, b0 + 1, c]
+                    v = c000 + (c111 - c011) * rx + (c011 - c001) * ry + (c001 - c000) * rz
+                out[y, x, c] = np.uint8(min(max(v + 0.5, 0.0), 255.0))
+
+
+def apply_clut(img: Image.Image, clut: np.ndarray) -> Image.Image:
+    """Convierte una imagen RGB/RGBA a CMYK interpolando el CLUT (el alpha se ignora)."""
+    out = np.empty((img.height, img.width, 4), dtype=np.uint8)
+    src = np.asarray(img)
+    with _KERNEL_LOCK:
+        _tetrahedral_kernel(src, clut, out)
+    # Image.frombuffer comparte la memoria del array: no hay copia adicional
+    return Image.frombuffer('CMYK', img.size, out, 'raw', 'CMYK', 0, 1)